@@ -4,7 +4,88 @@ import json
 import sys
 from collections import Counter, defaultdict
 from datetime import datetime, timezone
-from xml.etree.ElementTree import iterparse
+from sys import intern
+
+from xml.parsers import expat
+
+try:
+    from lxml.etree import iterparse
+
+    HAVE_LXML = True
+except ImportError:
+    HAVE_LXML = False
+
+try:
+    import orjson
+
+    HAVE_ORJSON = True
+except ImportError:
+    HAVE_ORJSON = False
+
+READ_CHUNK_BYTES = 1 << 20
+
+
+class _StopScan(Exception):
+    pass
+
+
+def scan_lxml(path, handlers, max_elements=0):
+    # tag= makes lxml skip events for every other element (MetadataEntry,
+    # InstantaneousBeatsPerMinute, ...) in C; those are freed along with the
+    # matched element that contains them.
+    processed = 0
+    context = iterparse(path, events=("end",), tag=tuple(handlers), huge_tree=True)
+    for _event, elem in context:
+        handlers[elem.tag](elem)
+
+        elem.clear(keep_tail=True)
+        # lxml keeps cleared siblings attached to the root; drop them so
+        # memory stays flat on multi-GB exports.
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+        processed += 1
+        if max_elements and processed >= max_elements:
+            break
+
+
+def scan_expat(path, handlers, max_elements=0):
+    # Without lxml, drive expat directly: handlers get the attribute dict from
+    # the start tag and no Element objects or tree are ever built.
+    get_handler = handlers.get
+    processed = 0
+
+    def on_start(tag, attrs):
+        nonlocal processed
+        handler = get_handler(tag)
+        if handler is None:
+            return
+        handler(attrs)
+        processed += 1
+        if max_elements and processed >= max_elements:
+            raise _StopScan
+
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = on_start
+    with open(path, "rb") as f:
+        try:
+            while True:
+                chunk = f.read(READ_CHUNK_BYTES)
+                if not chunk:
+                    break
+                parser.Parse(chunk, False)
+            parser.Parse(b"", True)
+        except _StopScan:
+            pass
+
+
+def scan_export(path, handlers, max_elements=0):
+    """Call handlers[tag] for each matching element of export.xml.
+
+    Handlers only use .get(), so they accept an lxml element or the plain
+    attribute dict expat passes to start-tag callbacks.
+    """
+    scan = scan_lxml if HAVE_LXML else scan_expat
+    scan(path, handlers, max_elements)
 
 
 def parse_args():
@@ -26,20 +107,41 @@ def parse_args():
         "--max-elements",
         type=int,
         default=0,
-        help="Stop after processing this many elements (0 = no limit).",
+        help="Stop after processing this many summarized elements (0 = no limit).",
     )
     return parser.parse_args()
 
 
+def write_json_sections(f, sections):
+    """Write (key, build) pairs as one indented JSON object, one key at a time.
+
+    Matches json.dump(..., indent=2, ensure_ascii=False) on the assembled dict.
+    Keys are not re-sorted: counter sections are already ordered by count.
+    """
+    f.write("{")
+    for idx, (key, build) in enumerate(sections):
+        value = _json_dumps(build()).replace("\n", "\n  ")
+        f.write(f'{"," if idx else ""}\n  {json.dumps(key)}: {value}')
+    f.write("\n}")
+
+
+def _json_dumps(obj):
+    # Both branches produce the same 2-space indented UTF-8 text.
+    if HAVE_ORJSON:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(obj, indent=2, ensure_ascii=False)
+
+
 def main():
     args = parse_args()
 
-    totals = Counter()
-    record_types = Counter()
-    record_sources = Counter()
-    record_devices = Counter()
-    record_units_by_type = defaultdict(Counter)
-    record_source_versions = defaultdict(Counter)
+    # Record counters are plain int defaultdicts: the Record handler runs once
+    # per element and Counter's extra Python-level machinery adds up there.
+    record_types = defaultdict(int)
+    record_sources = defaultdict(int)
+    record_devices = defaultdict(int)
+    record_units_by_type = defaultdict(lambda: defaultdict(int))
+    record_source_versions = defaultdict(lambda: defaultdict(int))
 
     workout_types = Counter()
     workout_sources = Counter()
@@ -51,97 +153,119 @@ def main():
     audiogram_sources = Counter()
     vision_sources = Counter()
 
-    processed = 0
+    def on_record(elem):
+        get = elem.get
+        # type/unit/sourceName take a few dozen distinct values across millions
+        # of records; interning lets the counter lookups compare by identity.
+        rtype = intern(get("type", "Unknown"))
+        record_types[rtype] += 1
+        record_units_by_type[rtype][intern(get("unit") or "None")] += 1
+        source = intern(get("sourceName", "Unknown"))
+        record_sources[source] += 1
+        device = get("device")
+        if device:
+            record_devices[device] += 1
+        version = get("sourceVersion")
+        if version:
+            record_source_versions[source][version] += 1
+
+    def on_workout(elem):
+        get = elem.get
+        workout_types[get("workoutActivityType", "Unknown")] += 1
+        workout_sources[get("sourceName", "Unknown")] += 1
+        device = get("device")
+        if device:
+            workout_devices[device] += 1
+
+    def on_correlation(elem):
+        correlation_types[elem.get("type", "Unknown")] += 1
+
+    def on_activity_summary(elem):
+        activity_summary_sources[elem.get("sourceName", "Unknown")] += 1
+
+    def on_clinical_record(elem):
+        clinical_record_types[elem.get("type", "Unknown")] += 1
+
+    def on_audiogram(elem):
+        audiogram_sources[elem.get("sourceName", "Unknown")] += 1
+
+    def on_vision_prescription(elem):
+        vision_sources[elem.get("sourceName", "Unknown")] += 1
+
+    handlers = {
+        "Record": on_record,
+        "Workout": on_workout,
+        "Correlation": on_correlation,
+        "ActivitySummary": on_activity_summary,
+        "ClinicalRecord": on_clinical_record,
+        "Audiogram": on_audiogram,
+        "VisionPrescription": on_vision_prescription,
+    }
 
     try:
-        for _event, elem in iterparse(args.export, events=("end",)):
-            tag = elem.tag
-            if tag == "Record":
-                totals["Record"] += 1
-                attrs = elem.attrib
-                rtype = attrs.get("type", "Unknown")
-                record_types[rtype] += 1
-                unit = attrs.get("unit") or "None"
-                record_units_by_type[rtype][unit] += 1
-                source = attrs.get("sourceName", "Unknown")
-                record_sources[source] += 1
-                device = attrs.get("device")
-                if device:
-                    record_devices[device] += 1
-                version = attrs.get("sourceVersion")
-                if version:
-                    record_source_versions[source][version] += 1
-            elif tag == "Workout":
-                totals["Workout"] += 1
-                attrs = elem.attrib
-                wtype = attrs.get("workoutActivityType", "Unknown")
-                workout_types[wtype] += 1
-                source = attrs.get("sourceName", "Unknown")
-                workout_sources[source] += 1
-                device = attrs.get("device")
-                if device:
-                    workout_devices[device] += 1
-            elif tag == "Correlation":
-                totals["Correlation"] += 1
-                ctype = elem.attrib.get("type", "Unknown")
-                correlation_types[ctype] += 1
-            elif tag == "ActivitySummary":
-                totals["ActivitySummary"] += 1
-                source = elem.attrib.get("sourceName", "Unknown")
-                activity_summary_sources[source] += 1
-            elif tag == "ClinicalRecord":
-                totals["ClinicalRecord"] += 1
-                ctype = elem.attrib.get("type", "Unknown")
-                clinical_record_types[ctype] += 1
-            elif tag == "Audiogram":
-                totals["Audiogram"] += 1
-                source = elem.attrib.get("sourceName", "Unknown")
-                audiogram_sources[source] += 1
-            elif tag == "VisionPrescription":
-                totals["VisionPrescription"] += 1
-                source = elem.attrib.get("sourceName", "Unknown")
-                vision_sources[source] += 1
-
-            elem.clear()
-            processed += 1
-            if args.max_elements and processed >= args.max_elements:
-                break
+        scan_export(args.export, handlers, args.max_elements)
     except FileNotFoundError:
         print(f"File not found: {args.export}", file=sys.stderr)
         return 2
 
-    def counter_to_dict(counter):
-        return dict(counter.most_common())
-
-    out = {
-        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
-        "export_path": args.export,
-        "totals": counter_to_dict(totals),
-        "record_types": counter_to_dict(record_types),
-        "record_sources": counter_to_dict(record_sources),
-        "record_devices": counter_to_dict(record_devices),
-        "record_units_by_type": {
-            rtype: counter_to_dict(units) for rtype, units in record_units_by_type.items()
-        },
-        "record_source_versions": {
-            source: counter_to_dict(versions)
-            for source, versions in record_source_versions.items()
-        },
-        "workout_types": counter_to_dict(workout_types),
-        "workout_sources": counter_to_dict(workout_sources),
-        "workout_devices": counter_to_dict(workout_devices),
-        "correlation_types": counter_to_dict(correlation_types),
-        "activity_summary_sources": counter_to_dict(activity_summary_sources),
-        "clinical_record_types": counter_to_dict(clinical_record_types),
-        "audiogram_sources": counter_to_dict(audiogram_sources),
-        "vision_sources": counter_to_dict(vision_sources),
-    }
+    # Per-tag totals fall out of the per-type counters, so the handlers do not
+    # maintain a separate running total. Unary + drops tags that never appeared.
+    totals = +Counter(
+        {
+            "Record": sum(record_types.values()),
+            "Workout": sum(workout_types.values()),
+            "Correlation": sum(correlation_types.values()),
+            "ActivitySummary": sum(activity_summary_sources.values()),
+            "ClinicalRecord": sum(clinical_record_types.values()),
+            "Audiogram": sum(audiogram_sources.values()),
+            "VisionPrescription": sum(vision_sources.values()),
+        }
+    )
+
+    def counter_to_dict(counts):
+        return dict(Counter(counts).most_common())
+
+    # Each section is built only when it is written, so the full report never
+    # exists in memory as one nested dict alongside the counters.
+    sections = [
+        (
+            "generated_at",
+            lambda: datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        ),
+        ("export_path", lambda: args.export),
+        ("totals", lambda: counter_to_dict(totals)),
+        ("record_types", lambda: counter_to_dict(record_types)),
+        ("record_sources", lambda: counter_to_dict(record_sources)),
+        ("record_devices", lambda: counter_to_dict(record_devices)),
+        (
+            "record_units_by_type",
+            lambda: {
+                rtype: counter_to_dict(units)
+                for rtype, units in record_units_by_type.items()
+            },
+        ),
+        (
+            "record_source_versions",
+            lambda: {
+                source: counter_to_dict(versions)
+                for source, versions in record_source_versions.items()
+            },
+        ),
+        ("workout_types", lambda: counter_to_dict(workout_types)),
+        ("workout_sources", lambda: counter_to_dict(workout_sources)),
+        ("workout_devices", lambda: counter_to_dict(workout_devices)),
+        ("correlation_types", lambda: counter_to_dict(correlation_types)),
+        ("activity_summary_sources", lambda: counter_to_dict(activity_summary_sources)),
+        ("clinical_record_types", lambda: counter_to_dict(clinical_record_types)),
+        ("audiogram_sources", lambda: counter_to_dict(audiogram_sources)),
+        ("vision_sources", lambda: counter_to_dict(vision_sources)),
+    ]
 
     with open(args.out, "w", encoding="utf-8") as f:
-        json.dump(out, f, indent=2, sort_keys=True)
+        write_json_sections(f, sections)
 
     print(f"Wrote {args.out}")
-    print(f"Totals: {out['totals']}")
+    print(f"Totals: {counter_to_dict(totals)}")
     print(f"Record types: {len(record_types)}")
     print(f"Workout types: {len(workout_types)}")
 
@@ -2,15 +2,17 @@
 import argparse
 import os
 import sqlite3
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
-os.environ.setdefault("MPLCONFIGDIR", os.path.join(os.getcwd(), ".mplconfig"))
+import numpy as np
 
-import matplotlib
+os.environ.setdefault("MPLCONFIGDIR", os.path.join(os.getcwd(), ".mplconfig"))
 
-matplotlib.use("Agg")
 import matplotlib.dates as mdates
-import matplotlib.pyplot as plt
+import matplotlib.style
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 
 
 def parse_args():
@@ -40,6 +42,10 @@ PALETTE = {
     "gray": "#64748b",
 }
 
+# Thin line for the unsmoothed daily series. Rasterizing it keeps thousands of
+# faint segments out of vector outputs (SVG/PDF); PNG output is unaffected.
+RAW_LINE = {"alpha": 0.25, "linewidth": 0.8, "rasterized": True}
+
 
 def ensure_views(conn):
     cursor = conn.execute(
@@ -47,33 +53,79 @@ def ensure_views(conn):
     )
     if cursor.fetchone() is None:
         raise RuntimeError(
-            "records_norm view missing. Run scripts/health_postprocess.py first."
+            "records_norm view missing. Run scripts/health_postprocess.py first "
+            "(it also creates the records(type, start_date) index these plots use)."
         )
 
 
-def fetch_rows(conn, sql, params=None):
-    cur = conn.execute(sql, params or ())
-    return cur.fetchall()
+PLOT_RECORD_TYPES = (
+    "HKQuantityTypeIdentifierStepCount",
+    "HKQuantityTypeIdentifierActiveEnergyBurned",
+    "HKCategoryTypeIdentifierSleepAnalysis",
+    "HKQuantityTypeIdentifierRestingHeartRate",
+    "HKQuantityTypeIdentifierHeartRateVariabilitySDNN",
+    "HKQuantityTypeIdentifierRespiratoryRate",
+    "HKQuantityTypeIdentifierTimeInDaylight",
+    "HKQuantityTypeIdentifierEnvironmentalAudioExposure",
+    "HKQuantityTypeIdentifierHeadphoneAudioExposure",
+)
+
+
+def tune_connection(conn):
+    # Read-only workload: give SQLite a large page cache and memory-map the
+    # file so the scans below stay in memory.
+    conn.execute("PRAGMA cache_size=-524288;")
+    conn.execute("PRAGMA temp_store=MEMORY;")
+    conn.execute("PRAGMA mmap_size=1073741824;")
+
+
+def build_plot_records(conn):
+    # Scan records_norm once for every type the plots use; each plot then
+    # aggregates this much smaller temp table instead of re-running the view.
+    placeholders = ", ".join("?" for _ in PLOT_RECORD_TYPES)
+    conn.execute("DROP TABLE IF EXISTS temp.plot_records")
+    conn.execute(
+        f"""
+        CREATE TEMP TABLE plot_records AS
+        SELECT
+          date(start_dt) AS day,
+          type,
+          value,
+          value_num,
+          start_dt,
+          end_dt,
+          source_name_norm
+        FROM records_norm
+        WHERE type IN ({placeholders})
+        """,
+        PLOT_RECORD_TYPES,
+    )
+
+
+def fetch_columns(conn, sql, params=None):
+    # Column-major result: one tuple per selected column, [] for no rows.
+    rows = conn.execute(sql, params or ()).fetchall()
+    return list(zip(*rows)) if rows else []
 
 
-def to_dates(rows):
-    return [datetime.strptime(row[0], "%Y-%m-%d") for row in rows]
+def as_floats(column):
+    # NULLs become NaN, which matplotlib leaves as gaps.
+    return np.array(column, dtype=np.float64)
+
+
+def to_dates(days):
+    # ISO day strings parse straight into datetime64, which matplotlib's date
+    # axis accepts without converting back to datetime objects.
+    return np.array(days, dtype="datetime64[D]")
 
 
 def rolling_avg(values, window):
-    if not values:
-        return []
-    out = []
-    buf = []
-    total = 0.0
-    for value in values:
-        value = 0.0 if value is None else float(value)
-        buf.append(value)
-        total += value
-        if len(buf) > window:
-            total -= buf.pop(0)
-        out.append(total / len(buf))
-    return out
+    # Trailing mean over up to `window` values; missing values count as 0.
+    arr = np.nan_to_num(np.asarray(values, dtype=np.float64), nan=0.0)
+    csum = np.cumsum(arr)
+    totals = csum.copy()
+    totals[window:] -= csum[:-window]
+    return totals / np.minimum(np.arange(1, arr.size + 1), window)
 
 
 def format_time_axis(ax):
@@ -83,44 +135,75 @@ def format_time_axis(ax):
     ax.grid(True, axis="y", alpha=0.2)
 
 
+# Figures are reused per size within a process; pyplot is never involved, so
+# there is no global figure registry to close them from.
+_figures = {}
+
+
+def get_figure(figsize):
+    fig = _figures.get(figsize)
+    if fig is None:
+        fig = Figure(figsize=figsize)
+        FigureCanvasAgg(fig)
+        _figures[figsize] = fig
+    else:
+        fig.clear()
+    return fig
+
+
 def save_fig(fig, path):
     fig.tight_layout()
     fig.savefig(path, dpi=160)
-    plt.close(fig)
 
 
-def plot_daily_activity(conn, out_dir):
-    rows = fetch_rows(
+def query_daily_activity(conn):
+    return fetch_columns(
         conn,
         """
-        SELECT
-          date(start_dt) AS day,
-          COALESCE(SUM(CASE WHEN type = 'HKQuantityTypeIdentifierStepCount' THEN value_num END), 0) AS steps,
-          COALESCE(SUM(CASE WHEN type = 'HKQuantityTypeIdentifierActiveEnergyBurned' THEN value_num END), 0) AS active_kcal
-        FROM records_norm
-        WHERE type IN (
-          'HKQuantityTypeIdentifierStepCount',
-          'HKQuantityTypeIdentifierActiveEnergyBurned'
+        WITH daily AS (
+          SELECT
+            day,
+            COALESCE(SUM(CASE WHEN type = 'HKQuantityTypeIdentifierStepCount' THEN value_num END), 0) AS steps,
+            COALESCE(SUM(CASE WHEN type = 'HKQuantityTypeIdentifierActiveEnergyBurned' THEN value_num END), 0) AS active_kcal
+          FROM plot_records
+          WHERE type IN (
+            'HKQuantityTypeIdentifierStepCount',
+            'HKQuantityTypeIdentifierActiveEnergyBurned'
+          )
+          GROUP BY day
         )
-        GROUP BY day
+        SELECT
+          day,
+          steps,
+          AVG(steps) OVER (ORDER BY day ROWS BETWEEN 6 PRECEDING AND CURRENT ROW) AS steps_7d,
+          active_kcal,
+          AVG(active_kcal) OVER (ORDER BY day ROWS BETWEEN 6 PRECEDING AND CURRENT ROW) AS active_kcal_7d
+        FROM daily
         ORDER BY day
         """,
     )
-    if not rows:
-        return None
-    dates = to_dates(rows)
-    steps = [row[1] for row in rows]
-    active = [row[2] for row in rows]
 
-    fig, axes = plt.subplots(2, 1, figsize=(12, 7), sharex=True)
-    axes[0].plot(dates, steps, color=PALETTE["blue"], alpha=0.25, linewidth=0.8)
-    axes[0].plot(dates, rolling_avg(steps, 7), color=PALETTE["blue"], linewidth=2)
+
+def plot_daily_activity(columns, out_dir):
+    if not columns:
+        return None
+    days, steps, steps_7d, active, active_7d = columns
+    dates = to_dates(days)
+    steps = as_floats(steps)
+    steps_7d = as_floats(steps_7d)
+    active = as_floats(active)
+    active_7d = as_floats(active_7d)
+
+    fig = get_figure((12, 7))
+    axes = fig.subplots(2, 1, sharex=True)
+    axes[0].plot(dates, steps, color=PALETTE["blue"], **RAW_LINE)
+    axes[0].plot(dates, steps_7d, color=PALETTE["blue"], linewidth=2)
     axes[0].set_title("Daily Steps (7-day avg)")
     axes[0].set_ylabel("Steps")
     format_time_axis(axes[0])
 
-    axes[1].plot(dates, active, color=PALETTE["orange"], alpha=0.25, linewidth=0.8)
-    axes[1].plot(dates, rolling_avg(active, 7), color=PALETTE["orange"], linewidth=2)
+    axes[1].plot(dates, active, color=PALETTE["orange"], **RAW_LINE)
+    axes[1].plot(dates, active_7d, color=PALETTE["orange"], linewidth=2)
     axes[1].set_title("Active Energy (7-day avg)")
     axes[1].set_ylabel("kcal")
     format_time_axis(axes[1])
@@ -130,32 +213,46 @@ def plot_daily_activity(conn, out_dir):
     return path
 
 
-def plot_sleep_efficiency(conn, out_dir):
-    rows = fetch_rows(
+def query_sleep_efficiency(conn):
+    return fetch_columns(
         conn,
         """
+        WITH daily AS (
+          SELECT
+            day,
+            SUM(CASE WHEN value LIKE '%Asleep%' THEN (julianday(end_dt) - julianday(start_dt)) * 24.0 END) AS asleep_hours,
+            SUM(CASE WHEN value LIKE '%InBed%' THEN (julianday(end_dt) - julianday(start_dt)) * 24.0 END) AS in_bed_hours
+          FROM plot_records
+          WHERE type = 'HKCategoryTypeIdentifierSleepAnalysis'
+          GROUP BY day
+        )
         SELECT
-          date(start_dt) AS day,
-          SUM(CASE WHEN value LIKE '%Asleep%' THEN (julianday(end_dt) - julianday(start_dt)) * 24.0 END) AS asleep_hours,
-          SUM(CASE WHEN value LIKE '%InBed%' THEN (julianday(end_dt) - julianday(start_dt)) * 24.0 END) AS in_bed_hours
-        FROM records_norm
-        WHERE type = 'HKCategoryTypeIdentifierSleepAnalysis'
-        GROUP BY day
+          day,
+          asleep_hours,
+          in_bed_hours,
+          AVG(COALESCE(asleep_hours, 0)) OVER (ORDER BY day ROWS BETWEEN 6 PRECEDING AND CURRENT ROW) AS asleep_7d
+        FROM daily
         ORDER BY day
         """,
     )
-    if not rows:
+
+
+def plot_sleep_efficiency(columns, out_dir):
+    if not columns:
         return None
-    dates = to_dates(rows)
-    asleep = [row[1] for row in rows]
-    in_bed = [row[2] for row in rows]
-    efficiency = [
-        (a / b) if a is not None and b else None for a, b in zip(asleep, in_bed)
-    ]
-
-    fig, ax = plt.subplots(figsize=(12, 4.5))
-    ax.plot(dates, asleep, color=PALETTE["teal"], alpha=0.25, linewidth=0.8)
-    ax.plot(dates, rolling_avg(asleep, 7), color=PALETTE["teal"], linewidth=2)
+    days, asleep, in_bed, asleep_7d = columns
+    dates = to_dates(days)
+    asleep = as_floats(asleep)
+    in_bed = as_floats(in_bed)
+    asleep_7d = as_floats(asleep_7d)
+    efficiency = np.divide(
+        asleep, in_bed, out=np.full_like(asleep, np.nan), where=in_bed > 0
+    )
+
+    fig = get_figure((12, 4.5))
+    ax = fig.subplots()
+    ax.plot(dates, asleep, color=PALETTE["teal"], **RAW_LINE)
+    ax.plot(dates, asleep_7d, color=PALETTE["teal"], linewidth=2)
     ax.set_ylabel("Hours asleep")
     ax.set_title("Sleep Duration & Efficiency")
     format_time_axis(ax)
@@ -170,19 +267,19 @@ def plot_sleep_efficiency(conn, out_dir):
     return path
 
 
-def plot_recovery_score(conn, out_dir):
-    rows = fetch_rows(
+def query_recovery_score(conn):
+    return fetch_columns(
         conn,
         """
         WITH daily AS (
           SELECT
-            date(start_dt) AS day,
+            day,
             AVG(CASE WHEN type = 'HKQuantityTypeIdentifierRestingHeartRate' THEN value_num END) AS rhr,
             AVG(CASE WHEN type = 'HKQuantityTypeIdentifierHeartRateVariabilitySDNN' THEN value_num END) AS hrv,
             AVG(CASE WHEN type = 'HKQuantityTypeIdentifierRespiratoryRate' THEN value_num END) AS resp,
             SUM(CASE WHEN type = 'HKCategoryTypeIdentifierSleepAnalysis' AND value LIKE '%Asleep%'
               THEN (julianday(end_dt) - julianday(start_dt)) * 24.0 END) AS sleep_hours
-          FROM records_norm
+          FROM plot_records
           WHERE type IN (
             'HKQuantityTypeIdentifierRestingHeartRate',
             'HKQuantityTypeIdentifierHeartRateVariabilitySDNN',
@@ -220,13 +317,18 @@ def plot_recovery_score(conn, out_dir):
         ORDER BY day
         """,
     )
-    if not rows:
+
+
+def plot_recovery_score(columns, out_dir):
+    if not columns:
         return None
-    dates = to_dates(rows)
-    scores = [row[1] for row in rows]
+    days, scores = columns
+    dates = to_dates(days)
+    scores = as_floats(scores)
 
-    fig, ax = plt.subplots(figsize=(12, 4.5))
-    ax.plot(dates, scores, color=PALETTE["green"], alpha=0.25, linewidth=0.8)
+    fig = get_figure((12, 4.5))
+    ax = fig.subplots()
+    ax.plot(dates, scores, color=PALETTE["green"], **RAW_LINE)
     ax.plot(dates, rolling_avg(scores, 7), color=PALETTE["green"], linewidth=2)
     ax.axhline(0, color=PALETTE["gray"], linewidth=1, alpha=0.5)
     ax.set_title("Recovery Score (28-day baseline)")
@@ -238,13 +340,13 @@ def plot_recovery_score(conn, out_dir):
     return path
 
 
-def plot_social_jetlag(conn, out_dir):
-    rows = fetch_rows(
+def query_social_jetlag(conn):
+    return fetch_columns(
         conn,
         """
         WITH asleep AS (
           SELECT start_dt, end_dt
-          FROM records_norm
+          FROM plot_records
           WHERE type = 'HKCategoryTypeIdentifierSleepAnalysis'
             AND value LIKE '%Asleep%'
         ),
@@ -272,13 +374,18 @@ def plot_social_jetlag(conn, out_dir):
         ORDER BY weekday
         """,
     )
-    if not rows:
+
+
+def plot_social_jetlag(columns, out_dir):
+    if not columns:
         return None
+    weekday_nums, values = columns
     weekdays = ["Sun", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat"]
-    x_labels = [weekdays[int(row[0])] for row in rows]
-    values = [row[1] for row in rows]
+    x_labels = [weekdays[int(num)] for num in weekday_nums]
+    values = as_floats(values)
 
-    fig, ax = plt.subplots(figsize=(8, 4.5))
+    fig = get_figure((8, 4.5))
+    ax = fig.subplots()
     ax.bar(x_labels, values, color=PALETTE["pink"], alpha=0.85)
     ax.set_title("Average Sleep Midpoint by Weekday")
     ax.set_ylabel("Midpoint hour")
@@ -289,15 +396,15 @@ def plot_social_jetlag(conn, out_dir):
     return path
 
 
-def plot_monotony_strain(conn, out_dir):
-    rows = fetch_rows(
+def query_monotony_strain(conn):
+    return fetch_columns(
         conn,
         """
         WITH daily AS (
           SELECT
-            date(start_dt) AS day,
+            day,
             COALESCE(SUM(CASE WHEN type = 'HKQuantityTypeIdentifierActiveEnergyBurned' THEN value_num END), 0) AS energy_kcal
-          FROM records_norm
+          FROM plot_records
           WHERE type = 'HKQuantityTypeIdentifierActiveEnergyBurned'
           GROUP BY day
         ),
@@ -337,13 +444,17 @@ def plot_monotony_strain(conn, out_dir):
         ORDER BY week
         """,
     )
-    if not rows:
+
+
+def plot_monotony_strain(columns, out_dir):
+    if not columns:
         return None
-    weeks = [row[0] for row in rows]
-    monotony = [row[3] for row in rows]
-    strain = [row[5] for row in rows]
+    weeks, _mean_load, _load_stddev, monotony, _total_load, strain = columns
+    monotony = as_floats(monotony)
+    strain = as_floats(strain)
 
-    fig, axes = plt.subplots(2, 1, figsize=(12, 7), sharex=True)
+    fig = get_figure((12, 7))
+    axes = fig.subplots(2, 1, sharex=True)
     axes[0].plot(weeks, monotony, color=PALETTE["orange"], linewidth=1.8)
     axes[0].set_title("Training Monotony (weekly)")
     axes[0].set_ylabel("Monotony")
@@ -360,16 +471,16 @@ def plot_monotony_strain(conn, out_dir):
     return path
 
 
-def plot_oura_watch_bias(conn, out_dir):
-    rows = fetch_rows(
+def query_oura_watch_bias(conn):
+    return fetch_columns(
         conn,
         """
         WITH daily AS (
           SELECT
-            date(start_dt) AS day,
+            day,
             source_name_norm,
             AVG(value_num) AS rhr
-          FROM records_norm
+          FROM plot_records
           WHERE type = 'HKQuantityTypeIdentifierRestingHeartRate'
             AND source_name_norm IN ('Oura', 'Colin''s Apple Watch')
           GROUP BY day, source_name_norm
@@ -381,23 +492,36 @@ def plot_oura_watch_bias(conn, out_dir):
             MAX(CASE WHEN source_name_norm = 'Colin''s Apple Watch' THEN rhr END) AS watch_rhr
           FROM daily
           GROUP BY day
+        ),
+        deltas AS (
+          SELECT
+            day,
+            oura_rhr - watch_rhr AS delta
+          FROM paired
+          WHERE oura_rhr IS NOT NULL AND watch_rhr IS NOT NULL
         )
         SELECT
           day,
-          oura_rhr - watch_rhr AS delta
-        FROM paired
-        WHERE oura_rhr IS NOT NULL AND watch_rhr IS NOT NULL
+          delta,
+          AVG(delta) OVER (ORDER BY day ROWS BETWEEN 13 PRECEDING AND CURRENT ROW) AS delta_14d
+        FROM deltas
         ORDER BY day
         """,
     )
-    if not rows:
-        return None
-    dates = to_dates(rows)
-    deltas = [row[1] for row in rows]
 
-    fig, ax = plt.subplots(figsize=(12, 4.5))
-    ax.plot(dates, deltas, color=PALETTE["blue"], alpha=0.25, linewidth=0.8)
-    ax.plot(dates, rolling_avg(deltas, 14), color=PALETTE["blue"], linewidth=2)
+
+def plot_oura_watch_bias(columns, out_dir):
+    if not columns:
+        return None
+    days, deltas, deltas_14d = columns
+    dates = to_dates(days)
+    deltas = as_floats(deltas)
+    deltas_14d = as_floats(deltas_14d)
+
+    fig = get_figure((12, 4.5))
+    ax = fig.subplots()
+    ax.plot(dates, deltas, color=PALETTE["blue"], **RAW_LINE)
+    ax.plot(dates, deltas_14d, color=PALETTE["blue"], linewidth=2)
     ax.axhline(0, color=PALETTE["gray"], linewidth=1, alpha=0.5)
     ax.set_title("Oura vs Apple Watch Resting HR Bias")
     ax.set_ylabel("Oura - Watch (bpm)")
@@ -408,23 +532,23 @@ def plot_oura_watch_bias(conn, out_dir):
     return path
 
 
-def plot_daylight_sleep(conn, out_dir):
-    rows = fetch_rows(
+def query_daylight_sleep(conn):
+    return fetch_columns(
         conn,
         """
         WITH daylight AS (
           SELECT
-            date(start_dt) AS day,
+            day,
             SUM(value_num) AS daylight_minutes
-          FROM records_norm
+          FROM plot_records
           WHERE type = 'HKQuantityTypeIdentifierTimeInDaylight'
           GROUP BY day
         ),
         sleep AS (
           SELECT
-            date(start_dt) AS day,
+            day,
             SUM(CASE WHEN value LIKE '%Asleep%' THEN (julianday(end_dt) - julianday(start_dt)) * 24.0 END) AS asleep_hours
-          FROM records_norm
+          FROM plot_records
           WHERE type = 'HKCategoryTypeIdentifierSleepAnalysis'
           GROUP BY day
         )
@@ -438,12 +562,17 @@ def plot_daylight_sleep(conn, out_dir):
         ORDER BY daylight.day
         """,
     )
-    if not rows:
+
+
+def plot_daylight_sleep(columns, out_dir):
+    if not columns:
         return None
-    daylight = [row[1] for row in rows]
-    asleep = [row[2] for row in rows]
+    _days, daylight, asleep = columns
+    daylight = as_floats(daylight)
+    asleep = as_floats(asleep)
 
-    fig, ax = plt.subplots(figsize=(6.5, 5.5))
+    fig = get_figure((6.5, 5.5))
+    ax = fig.subplots()
     ax.scatter(daylight, asleep, color=PALETTE["teal"], alpha=0.5, s=16)
     ax.set_title("Time in Daylight vs Sleep Duration")
     ax.set_xlabel("Daylight minutes")
@@ -455,16 +584,16 @@ def plot_daylight_sleep(conn, out_dir):
     return path
 
 
-def plot_audio_sleep(conn, out_dir):
-    rows = fetch_rows(
+def query_audio_sleep(conn):
+    return fetch_columns(
         conn,
         """
         WITH audio AS (
           SELECT
-            date(start_dt) AS day,
+            day,
             AVG(CASE WHEN type = 'HKQuantityTypeIdentifierEnvironmentalAudioExposure' THEN value_num END) AS env_audio,
             AVG(CASE WHEN type = 'HKQuantityTypeIdentifierHeadphoneAudioExposure' THEN value_num END) AS headphone_audio
-          FROM records_norm
+          FROM plot_records
           WHERE type IN (
             'HKQuantityTypeIdentifierEnvironmentalAudioExposure',
             'HKQuantityTypeIdentifierHeadphoneAudioExposure'
@@ -473,9 +602,9 @@ def plot_audio_sleep(conn, out_dir):
         ),
         sleep AS (
           SELECT
-            date(start_dt) AS day,
+            day,
             SUM(CASE WHEN value LIKE '%Asleep%' THEN (julianday(end_dt) - julianday(start_dt)) * 24.0 END) AS asleep_hours
-          FROM records_norm
+          FROM plot_records
           WHERE type = 'HKCategoryTypeIdentifierSleepAnalysis'
           GROUP BY day
         )
@@ -489,12 +618,17 @@ def plot_audio_sleep(conn, out_dir):
         ORDER BY audio.day
         """,
     )
-    if not rows:
+
+
+def plot_audio_sleep(columns, out_dir):
+    if not columns:
         return None
-    headphone = [row[1] for row in rows]
-    asleep = [row[2] for row in rows]
+    _days, headphone, asleep = columns
+    headphone = as_floats(headphone)
+    asleep = as_floats(asleep)
 
-    fig, ax = plt.subplots(figsize=(6.5, 5.5))
+    fig = get_figure((6.5, 5.5))
+    ax = fig.subplots()
     ax.scatter(headphone, asleep, color=PALETTE["orange"], alpha=0.5, s=16)
     ax.set_title("Headphone Audio Exposure vs Sleep Duration")
     ax.set_xlabel("Headphone audio (avg dB)")
@@ -506,27 +640,57 @@ def plot_audio_sleep(conn, out_dir):
     return path
 
 
+PLOTS = (
+    (query_daily_activity, plot_daily_activity),
+    (query_sleep_efficiency, plot_sleep_efficiency),
+    (query_recovery_score, plot_recovery_score),
+    (query_social_jetlag, plot_social_jetlag),
+    (query_monotony_strain, plot_monotony_strain),
+    (query_oura_watch_bias, plot_oura_watch_bias),
+    (query_daylight_sleep, plot_daylight_sleep),
+    (query_audio_sleep, plot_audio_sleep),
+)
+
+
+def _init_worker():
+    matplotlib.style.use("seaborn-v0_8")
+    # Let Agg merge nearly collinear segments of multi-year daily series and
+    # stroke long paths in chunks.
+    matplotlib.rcParams.update(
+        {
+            "path.simplify": True,
+            "path.simplify_threshold": 1.0,
+            "agg.path.chunksize": 10000,
+        }
+    )
+
+
+def _run_plot(plot, columns, out_dir):
+    return plot(columns, out_dir)
+
+
 def main():
     args = parse_args()
     os.makedirs(args.out_dir, exist_ok=True)
 
-    plt.style.use("seaborn-v0_8")
+    # All SQL runs here, on one connection: plot_records is built once and
+    # only the small per-plot aggregates are sent to the render workers.
     conn = sqlite3.connect(args.db)
     try:
         ensure_views(conn)
-        outputs = [
-            plot_daily_activity(conn, args.out_dir),
-            plot_sleep_efficiency(conn, args.out_dir),
-            plot_recovery_score(conn, args.out_dir),
-            plot_social_jetlag(conn, args.out_dir),
-            plot_monotony_strain(conn, args.out_dir),
-            plot_oura_watch_bias(conn, args.out_dir),
-            plot_daylight_sleep(conn, args.out_dir),
-            plot_audio_sleep(conn, args.out_dir),
-        ]
+        tune_connection(conn)
+        build_plot_records(conn)
+        results = [query(conn) for query, _plot in PLOTS]
     finally:
         conn.close()
 
+    # Plots are independent and matplotlib is not thread-safe, so render them
+    # in separate processes.
+    workers = min(len(PLOTS), os.cpu_count() or 1)
+    plots = [plot for _query, plot in PLOTS]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        outputs = list(pool.map(_run_plot, plots, results, repeat(args.out_dir)))
+
     outputs = [path for path in outputs if path]
     for path in outputs:
         print(f"Wrote {path}")
@@ -6,8 +6,27 @@ import math
 import os
 import re
 import sqlite3
-from collections import defaultdict
-from xml.etree.ElementTree import iterparse
+import sys
+from array import array
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import count, groupby, repeat
+
+try:
+    from lxml.etree import iterparse
+
+    HAVE_LXML = True
+except ImportError:
+    from xml.etree.ElementTree import iterparse
+
+    HAVE_LXML = False
+
+try:
+    import orjson
+
+    HAVE_ORJSON = True
+except ImportError:
+    HAVE_ORJSON = False
 
 
 def parse_args():
@@ -50,10 +69,26 @@ def parse_args():
         action="store_true",
         help="Skip ECG import.",
     )
+    parser.add_argument(
+        "--refresh-route-distances",
+        action="store_true",
+        help="Recompute workout route distances from the stored route points.",
+    )
+    parser.add_argument(
+        "--rebuild-daily-aggregates",
+        action="store_true",
+        help="Rebuild records_daily/sleep_daily even if records look unchanged.",
+    )
     parser.set_defaults(skip_existing=True)
     return parser.parse_args()
 
 
+_NUMBER_RE = re.compile(r"^[+-]?\d+(\.\d+)?$")
+# A waveform body of only _NUMBER_RE values (or blank lines), one per line.
+_SAMPLE_LINES_RE = re.compile(r"(?:[ \t]*(?:[+-]?\d+(?:\.\d+)?)?[ \t]*(?:\r?\n|\Z))*")
+_SAMPLE_RATE_RE = re.compile(r"[0-9]+(?:\.[0-9]+)?")
+
+
 SCHEMA = """
 CREATE TABLE IF NOT EXISTS source_aliases (
   raw_source TEXT PRIMARY KEY,
@@ -79,8 +114,9 @@ CREATE TABLE IF NOT EXISTS workout_route_points (
   lat REAL,
   lon REAL,
   ele REAL,
-  time TEXT
-);
+  time TEXT,
+  PRIMARY KEY (route_id, point_index)
+) WITHOUT ROWID;
 
 CREATE TABLE IF NOT EXISTS ecg_records (
   id INTEGER PRIMARY KEY,
@@ -93,31 +129,106 @@ CREATE TABLE IF NOT EXISTS ecg_records (
   unit TEXT,
   device TEXT,
   software_version TEXT,
-  extra_json TEXT
+  extra_json TEXT,
+  sample_count INTEGER,
+  ecg_waveform BLOB
+);
+
+CREATE TABLE IF NOT EXISTS records_daily (
+  type TEXT,
+  day TEXT,
+  avg_val REAL,
+  sum_val REAL,
+  cnt INTEGER,
+  PRIMARY KEY (type, day)
+);
+
+CREATE TABLE IF NOT EXISTS sleep_daily (
+  day TEXT PRIMARY KEY,
+  asleep_hours REAL
 );
 
-CREATE TABLE IF NOT EXISTS ecg_samples (
-  ecg_id INTEGER,
-  sample_index INTEGER,
-  value REAL
+CREATE TABLE IF NOT EXISTS daily_aggregates_marker (
+  records_count INTEGER,
+  records_max_rowid INTEGER
 );
 """
 
 
+_SOURCE_TRANS = str.maketrans({"\u2019": "'", "\u2018": "'", "\u00a0": " "})
+
+
 def normalize_source_name(value):
     if value is None:
         return None
-    cleaned = value.replace("\u2019", "'").replace("\u2018", "'")
-    cleaned = cleaned.replace("\u00a0", " ")
-    cleaned = re.sub(r"\s+", " ", cleaned).strip()
-    return cleaned
+    # Straighten curly quotes and NBSPs in one pass, then collapse whitespace.
+    return " ".join(value.translate(_SOURCE_TRANS).split())
 
 
 def init_db(conn):
     conn.executescript(SCHEMA)
+    migrate_route_points(conn)
+    migrate_ecg_samples(conn)
     conn.execute("PRAGMA journal_mode=WAL;")
     conn.execute("PRAGMA synchronous=NORMAL;")
     conn.execute("PRAGMA temp_store=MEMORY;")
+    conn.execute("PRAGMA cache_size=-262144;")
+    conn.execute("PRAGMA mmap_size=268435456;")
+    conn.execute("PRAGMA locking_mode=EXCLUSIVE;")
+    conn.execute("PRAGMA busy_timeout=5000;")
+    conn.execute("PRAGMA wal_autocheckpoint=1000;")
+
+
+def migrate_route_points(conn):
+    """Rebuild a rowid workout_route_points table as the keyed WITHOUT ROWID one."""
+    row = conn.execute(
+        "SELECT sql FROM sqlite_master "
+        "WHERE type = 'table' AND name = 'workout_route_points'"
+    ).fetchone()
+    if row is None or "WITHOUT ROWID" in row[0].upper():
+        return
+    conn.execute(
+        "ALTER TABLE workout_route_points RENAME TO workout_route_points_old"
+    )
+    conn.executescript(SCHEMA)
+    conn.execute(
+        """
+        INSERT OR IGNORE INTO workout_route_points (
+          route_id, point_index, lat, lon, ele, time
+        )
+        SELECT route_id, point_index, lat, lon, ele, time
+        FROM workout_route_points_old
+        """
+    )
+    # Also drops idx_workout_route_points_route, which the key makes redundant.
+    conn.execute("DROP TABLE workout_route_points_old")
+    conn.commit()
+
+
+def migrate_ecg_samples(conn):
+    """Move waveforms from the old one-row-per-sample ecg_samples table."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(ecg_records)")}
+    if "ecg_waveform" not in columns:
+        conn.execute("ALTER TABLE ecg_records ADD COLUMN sample_count INTEGER")
+        conn.execute("ALTER TABLE ecg_records ADD COLUMN ecg_waveform BLOB")
+    has_samples = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ecg_samples'"
+    ).fetchone()
+    if not has_samples:
+        return
+    rows = conn.execute(
+        "SELECT ecg_id, value FROM ecg_samples ORDER BY ecg_id, sample_index"
+    )
+    updates = []
+    for ecg_id, group in groupby(rows, key=lambda row: row[0]):
+        values = [row[1] for row in group]
+        updates.append((len(values), _pack_samples(values), ecg_id))
+    conn.executemany(
+        "UPDATE ecg_records SET sample_count = ?, ecg_waveform = ? WHERE id = ?",
+        updates,
+    )
+    conn.execute("DROP TABLE ecg_samples")
+    conn.commit()
 
 
 def create_views(conn):
@@ -161,41 +272,140 @@ def create_views(conn):
     conn.commit()
 
 
-def build_source_aliases(conn):
-    cursor = conn.cursor()
-    sources = set()
-    for table, column in [
-        ("records", "source_name"),
-        ("workouts", "source_name"),
-        ("correlations", "source_name"),
-        ("clinical_records", "source_name"),
-        ("audiograms", "source_name"),
-        ("vision_prescriptions", "source_name"),
-    ]:
+INDEXES = (
+    # Plot and dashboard queries filter records by type and bucket by day;
+    # a composite index turns those into range scans in start_date order.
+    "CREATE INDEX IF NOT EXISTS idx_records_type_start ON records(type, start_date)",
+    "CREATE INDEX IF NOT EXISTS idx_correlations_start ON correlations(start_date)",
+)
+
+
+def create_indexes(conn):
+    # idx_records_type(type) from older ingests is a prefix of
+    # idx_records_type_start, so it only costs space and write time.
+    conn.execute("DROP INDEX IF EXISTS idx_records_type")
+    for statement in INDEXES:
         try:
-            cursor.execute(f"SELECT DISTINCT {column} FROM {table}")
+            conn.execute(statement)
         except sqlite3.OperationalError:
+            # Table not present in this export.
             continue
-        sources.update(row[0] for row in cursor.fetchall() if row[0] is not None)
+    conn.commit()
+
 
-    rows = [(src, normalize_source_name(src)) for src in sources]
-    cursor.executemany(
-        "INSERT OR REPLACE INTO source_aliases (raw_source, normalized_source) VALUES (?, ?)",
-        rows,
+def refresh_daily_aggregates(conn, force=False):
+    # Per-day aggregates for the plotting scripts. day matches date(start_dt)
+    # in records_norm. The full rebuild is skipped when records still has the
+    # row count and max rowid recorded at the last rebuild.
+    has_records = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'records'"
+    ).fetchone()
+    if not has_records:
+        # Routes/ECG-only database: nothing to aggregate.
+        return
+    marker = conn.execute("SELECT COUNT(*), MAX(rowid) FROM records").fetchone()
+    stored = conn.execute(
+        "SELECT records_count, records_max_rowid FROM daily_aggregates_marker"
+    ).fetchone()
+    if not force and stored == marker:
+        return
+
+    conn.execute("DELETE FROM records_daily")
+    conn.execute(
+        """
+        INSERT INTO records_daily (type, day, avg_val, sum_val, cnt)
+        SELECT
+          type,
+          date(substr(start_date, 1, 19)) AS day,
+          AVG(CAST(value AS REAL)),
+          SUM(CAST(value AS REAL)),
+          COUNT(*)
+        FROM records
+        GROUP BY type, day
+        """
+    )
+    conn.execute("DELETE FROM sleep_daily")
+    conn.execute(
+        """
+        INSERT INTO sleep_daily (day, asleep_hours)
+        SELECT
+          date(substr(start_date, 1, 19)) AS day,
+          SUM(
+            CASE WHEN value LIKE '%Asleep%' THEN (
+              julianday(substr(end_date, 1, 19)) - julianday(substr(start_date, 1, 19))
+            ) * 24.0 END
+          )
+        FROM records
+        WHERE type = 'HKCategoryTypeIdentifierSleepAnalysis'
+        GROUP BY day
+        """
+    )
+    conn.execute("DELETE FROM daily_aggregates_marker")
+    conn.execute(
+        "INSERT INTO daily_aggregates_marker (records_count, records_max_rowid) "
+        "VALUES (?, ?)",
+        marker,
     )
+    conn.commit()
+
+
+SOURCE_TABLES = (
+    "records",
+    "workouts",
+    "correlations",
+    "clinical_records",
+    "audiograms",
+    "vision_prescriptions",
+)
+
+
+def build_source_aliases(conn):
+    # Distinct source names never leave SQLite: UNION deduplicates them across
+    # tables and norm_src runs normalize_source_name on each one.
+    conn.create_function("norm_src", 1, normalize_source_name, deterministic=True)
+    present = {
+        row[0]
+        for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    }
+    selects = [
+        f"SELECT source_name FROM {table} WHERE source_name IS NOT NULL"
+        for table in SOURCE_TABLES
+        if table in present
+    ]
+    if selects:
+        conn.execute(
+            f"""
+            INSERT OR REPLACE INTO source_aliases (raw_source, normalized_source)
+            SELECT source_name, norm_src(source_name)
+            FROM ({" UNION ".join(selects)})
+            """
+        )
     conn.execute(
         "CREATE INDEX IF NOT EXISTS idx_source_aliases_norm ON source_aliases(normalized_source)"
     )
     conn.commit()
 
 
-def list_existing(conn, table):
-    cursor = conn.cursor()
-    try:
-        cursor.execute(f"SELECT file_path FROM {table}")
-    except sqlite3.OperationalError:
-        return set()
-    return {row[0] for row in cursor.fetchall()}
+def is_imported(conn, table, path):
+    # file_path is UNIQUE, so this is a single index lookup per candidate file.
+    row = conn.execute(
+        f"SELECT 1 FROM {table} WHERE file_path = ? LIMIT 1", (path,)
+    ).fetchone()
+    return row is not None
+
+
+def _list_files(directory, suffix):
+    """Return paths of regular files in directory ending in suffix, by name."""
+    # scandir's entries carry the file type from readdir, so is_file() does
+    # not need a stat call per file.
+    with os.scandir(directory) as it:
+        entries = [
+            entry
+            for entry in it
+            if entry.name.lower().endswith(suffix) and entry.is_file()
+        ]
+    entries.sort(key=lambda entry: entry.name)
+    return [entry.path for entry in entries]
 
 
 def haversine_km(lat1, lon1, lat2, lon2):
@@ -210,236 +420,316 @@ def haversine_km(lat1, lon1, lat2, lon2):
     return 2 * r * math.asin(math.sqrt(a))
 
 
-def import_workout_routes(conn, routes_dir, skip_existing):
-    if not os.path.isdir(routes_dir):
-        return 0
-
-    existing = list_existing(conn, "workout_routes") if skip_existing else set()
-    route_rows = []
-    point_rows = []
-    route_id = _next_id(conn, "workout_routes")
-    inserted = 0
+def path_length_km(coords):
+    """Sum haversine_km over consecutive (lat, lon) pairs.
 
-    for name in sorted(os.listdir(routes_dir)):
-        if not name.lower().endswith(".gpx"):
+    Each point's radians and cos(lat) are computed once and reused for both
+    segments it belongs to.
+    """
+    r = 6371.0088
+    radians, sin, cos = math.radians, math.sin, math.cos
+    asin, sqrt = math.asin, math.sqrt
+    total = 0.0
+    prev = None
+    for lat, lon in coords:
+        phi = radians(lat)
+        lam = radians(lon)
+        cos_phi = cos(phi)
+        if prev is not None:
+            prev_phi, prev_lam, prev_cos = prev
+            a = sin((phi - prev_phi) / 2.0) ** 2 + prev_cos * cos_phi * sin(
+                (lam - prev_lam) / 2.0
+            ) ** 2
+            total += 2 * r * asin(sqrt(a))
+        prev = (phi, lam, cos_phi)
+    return total
+
+
+def _parse_gpx(path):
+    """Return (lats, lons, eles, times) columns for the trkpts in a GPX file.
+
+    lats/lons/eles are array("d") with NaN for missing values (SQLite stores a
+    NaN parameter as NULL); times is a list of strings or None.
+    """
+    trkpt_tag, ele_tag, time_tag = "trkpt", "ele", "time"
+    lats = array("d")
+    lons = array("d")
+    eles = array("d")
+    times = []
+    for event, elem in iterparse(path, events=("start-ns", "end")):
+        if event == "start-ns":
+            # Apple's GPX files declare the schema as the default namespace on
+            # <gpx>; resolve the full tag names once instead of stripping the
+            # namespace off every element.
+            prefix, uri = elem
+            if not prefix and trkpt_tag == "trkpt":
+                trkpt_tag, ele_tag, time_tag = (
+                    f"{{{uri}}}trkpt",
+                    f"{{{uri}}}ele",
+                    f"{{{uri}}}time",
+                )
             continue
-        path = os.path.join(routes_dir, name)
-        if skip_existing and path in existing:
+        if elem.tag != trkpt_tag:
             continue
+        get = elem.get
+        lats.append(_float_or_nan(get("lat")))
+        lons.append(_float_or_nan(get("lon")))
+        eles.append(_float_or_nan(elem.findtext(ele_tag)))
+        times.append(elem.findtext(time_tag) or None)
+        # Children are only read here, so they are cleared with their trkpt.
+        elem.clear()
+        if HAVE_LXML:
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+    return lats, lons, eles, times
 
-        points = []
-        for _event, elem in iterparse(path, events=("end",)):
-            tag = _strip_ns(elem.tag)
-            if tag == "trkpt":
-                lat = _to_float(elem.attrib.get("lat"))
-                lon = _to_float(elem.attrib.get("lon"))
-                ele = None
-                time = None
-                for child in elem:
-                    child_tag = _strip_ns(child.tag)
-                    if child_tag == "ele":
-                        ele = _to_float(child.text)
-                    elif child_tag == "time":
-                        time = child.text
-                points.append((lat, lon, ele, time))
-            elem.clear()
-
-        if not points:
-            continue
-
-        distance_km = 0.0
-        lats = [p[0] for p in points if p[0] is not None]
-        lons = [p[1] for p in points if p[1] is not None]
-        min_lat = min(lats) if lats else None
-        max_lat = max(lats) if lats else None
-        min_lon = min(lons) if lons else None
-        max_lon = max(lons) if lons else None
-        start_time = points[0][3]
-        end_time = points[-1][3]
-
-        last_point = None
-        for idx, (lat, lon, ele, time) in enumerate(points):
-            if lat is not None and lon is not None:
-                if last_point is not None:
-                    distance_km += haversine_km(
-                        lat, lon, last_point[0], last_point[1]
-                    )
-                last_point = (lat, lon)
-            point_rows.append((route_id, idx, lat, lon, ele, time))
-
-        route_rows.append(
-            (
-                route_id,
-                path,
-                start_time,
-                end_time,
-                len(points),
-                distance_km,
-                min_lat,
-                max_lat,
-                min_lon,
-                max_lon,
-            )
-        )
-        inserted += 1
-        route_id += 1
 
-        if len(point_rows) >= 20000:
-            _flush_routes(conn, route_rows, point_rows)
+def import_workout_routes(conn, routes_dir, skip_existing):
+    if not os.path.isdir(routes_dir):
+        return 0
 
-    _flush_routes(conn, route_rows, point_rows)
-    conn.execute(
-        "CREATE INDEX IF NOT EXISTS idx_workout_route_points_route ON workout_route_points(route_id)"
-    )
-    conn.execute(
-        "CREATE INDEX IF NOT EXISTS idx_workout_routes_start_time ON workout_routes(start_time)"
-    )
-    conn.commit()
-    return inserted
+    paths = [
+        path
+        for path in _list_files(routes_dir, ".gpx")
+        if not (skip_existing and is_imported(conn, "workout_routes", path))
+    ]
 
+    inserted = 0
+    for path, loaded in zip(paths, _map_in_workers(_load_route, paths)):
+        if loaded is None:
+            continue
+        summary, points = loaded
 
-def _flush_routes(conn, route_rows, point_rows):
-    if route_rows:
-        conn.executemany(
+        # SQLite assigns the id; the points need it, so the route row is
+        # inserted on its own rather than batched.
+        cursor = conn.execute(
             """
             INSERT OR IGNORE INTO workout_routes (
-              id, file_path, start_time, end_time, point_count, distance_km,
+              file_path, start_time, end_time, point_count, distance_km,
               min_lat, max_lat, min_lon, max_lon
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
-            route_rows,
+            (path, *summary),
         )
-        route_rows.clear()
-    if point_rows:
+        if not cursor.rowcount:
+            # Already imported under this path; don't add a second copy of
+            # its points.
+            continue
+        route_id = cursor.lastrowid
+
         conn.executemany(
             """
             INSERT INTO workout_route_points (
               route_id, point_index, lat, lon, ele, time
             ) VALUES (?, ?, ?, ?, ?, ?)
             """,
-            point_rows,
+            zip(repeat(route_id), count(), *points),
         )
-        point_rows.clear()
-    conn.commit()
-
-
-def import_ecg(conn, ecg_dir, skip_existing):
-    if not os.path.isdir(ecg_dir):
-        return 0
-
-    existing = list_existing(conn, "ecg_records") if skip_existing else set()
-    record_rows = []
-    sample_rows = []
-    ecg_id = _next_id(conn, "ecg_records")
-    inserted = 0
+        inserted += 1
 
-    for name in sorted(os.listdir(ecg_dir)):
-        if not name.lower().endswith(".csv"):
-            continue
-        path = os.path.join(ecg_dir, name)
-        if skip_existing and path in existing:
-            continue
+    # The whole import is one transaction: the first INSERT opens it and this
+    # commit (after the indexes) is the only one.
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_workout_routes_start_time ON workout_routes(start_time)"
+    )
+    conn.commit()
+    return inserted
 
-        metadata, samples = parse_ecg_csv(path)
-        if not samples:
-            continue
 
-        record_rows.append(
-            (
-                ecg_id,
-                path,
-                metadata.get("Recorded Date"),
-                metadata.get("Classification"),
-                metadata.get("Symptoms"),
-                _parse_sample_rate(metadata.get("Sample Rate")),
-                metadata.get("Lead"),
-                metadata.get("Unit"),
-                metadata.get("Device"),
-                metadata.get("Software Version"),
-                json.dumps(metadata, ensure_ascii=True),
+def refresh_route_distances(conn):
+    # Same result as path_length_km, computed from the points already in the
+    # DB: LAG pairs each valid point with the previous valid one in order.
+    conn.create_function("hav_km", 4, haversine_km, deterministic=True)
+    conn.execute(
+        """
+        UPDATE workout_routes
+        SET distance_km = COALESCE(
+          (
+            SELECT SUM(hav_km(lat, lon, prev_lat, prev_lon))
+            FROM (
+              SELECT
+                lat,
+                lon,
+                LAG(lat) OVER (ORDER BY point_index) AS prev_lat,
+                LAG(lon) OVER (ORDER BY point_index) AS prev_lon
+              FROM workout_route_points
+              WHERE route_id = workout_routes.id
+                AND lat IS NOT NULL
+                AND lon IS NOT NULL
             )
+            WHERE prev_lat IS NOT NULL
+          ),
+          0.0
         )
-        for idx, value in enumerate(samples):
-            sample_rows.append((ecg_id, idx, value))
+        """
+    )
+    conn.commit()
 
-        inserted += 1
-        ecg_id += 1
 
-        if len(sample_rows) >= 20000:
-            _flush_ecg(conn, record_rows, sample_rows)
+def _load_route(path):
+    """Parse and summarize one GPX file; runs in a worker process."""
+    points = _parse_gpx(path)
+    lats, lons, _eles, times = points
+    if not times:
+        return None
 
-    _flush_ecg(conn, record_rows, sample_rows)
-    conn.execute(
-        "CREATE INDEX IF NOT EXISTS idx_ecg_samples_ecg ON ecg_samples(ecg_id)"
+    # x == x is False only for NaN, i.e. a missing coordinate.
+    valid_lats = [lat for lat in lats if lat == lat]
+    valid_lons = [lon for lon in lons if lon == lon]
+    distance_km = path_length_km(
+        (lat, lon) for lat, lon in zip(lats, lons) if lat == lat and lon == lon
     )
-    conn.commit()
-    return inserted
+    summary = (
+        times[0],
+        times[-1],
+        len(times),
+        distance_km,
+        min(valid_lats) if valid_lats else None,
+        max(valid_lats) if valid_lats else None,
+        min(valid_lons) if valid_lons else None,
+        max(valid_lons) if valid_lons else None,
+    )
+    return summary, points
 
 
-def _flush_ecg(conn, record_rows, sample_rows):
-    if record_rows:
-        conn.executemany(
+def import_ecg(conn, ecg_dir, skip_existing):
+    if not os.path.isdir(ecg_dir):
+        return 0
+
+    paths = [
+        path
+        for path in _list_files(ecg_dir, ".csv")
+        if not (skip_existing and is_imported(conn, "ecg_records", path))
+    ]
+
+    inserted = 0
+    for path, row in zip(paths, _map_in_workers(_load_ecg, paths)):
+        if row is None:
+            continue
+        cursor = conn.execute(
             """
             INSERT OR IGNORE INTO ecg_records (
-              id, file_path, recorded_date, classification, symptoms,
-              sample_rate_hz, lead, unit, device, software_version, extra_json
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+              file_path, recorded_date, classification, symptoms,
+              sample_rate_hz, lead, unit, device, software_version, extra_json,
+              sample_count, ecg_waveform
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
-            record_rows,
-        )
-        record_rows.clear()
-    if sample_rows:
-        conn.executemany(
-            "INSERT INTO ecg_samples (ecg_id, sample_index, value) VALUES (?, ?, ?)",
-            sample_rows,
+            (path, *row),
         )
-        sample_rows.clear()
+        if cursor.rowcount:
+            inserted += 1
+
     conn.commit()
+    return inserted
+
+
+def _load_ecg(path):
+    """Parse one ECG CSV into an ecg_records row; runs in a worker process."""
+    metadata, samples = parse_ecg_csv(path)
+    if not samples:
+        return None
+    return (
+        metadata.get("Recorded Date"),
+        metadata.get("Classification"),
+        metadata.get("Symptoms"),
+        _parse_sample_rate(metadata.get("Sample Rate")),
+        metadata.get("Lead"),
+        metadata.get("Unit"),
+        metadata.get("Device"),
+        metadata.get("Software Version"),
+        _json_dumps(metadata),
+        len(samples),
+        _pack_samples(samples),
+    )
+
+
+def _map_in_workers(func, paths):
+    """Yield func(path) for each path, in order, computed in worker processes.
+
+    Parsing is CPU-bound and independent per file; the caller keeps all
+    SQLite writes on the main process. At most workers * 2 files are in
+    flight, so parsed results never pile up ahead of the writer.
+    """
+    if not paths:
+        return
+    workers = min(len(paths), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for path in paths:
+            pending.append(pool.submit(func, path))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _json_dumps(obj):
+    # Both branches produce the same compact UTF-8 text.
+    if HAVE_ORJSON:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _pack_samples(values):
+    # Waveforms are stored as little-endian float32, 4 bytes per sample.
+    samples = array("f", values)
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples.tobytes()
+
+
+def ecg_samples_array(blob):
+    """Decode an ecg_records.ecg_waveform BLOB into an array of floats."""
+    samples = array("f")
+    samples.frombytes(blob)
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples
 
 
 def parse_ecg_csv(path):
     metadata = {}
-    samples = []
-    number_re = re.compile(r"^[+-]?\d+(\.\d+)?$")
+    values = []
     with open(path, "r", encoding="utf-8", newline="") as f:
-        reader = csv.reader(f)
-        for row in reader:
-            if not row:
-                continue
-            if len(row) == 1:
-                value = row[0].strip()
-                if not value:
-                    continue
-                if number_re.match(value):
-                    samples.append(float(value))
-                else:
-                    continue
-            else:
-                key = row[0].strip()
-                value = row[1].strip() if len(row) > 1 else ""
-                metadata[key] = value
-    return metadata, samples
+        _read_ecg_rows(csv.reader(f), metadata, values, stop_at_sample=True)
+        rest = f.read()
+    # Everything after the header is normally the waveform, one value per
+    # line; that is converted in bulk rather than row by row through csv.
+    # Anything else (exponents, nan/inf, quoted or extra fields) takes the
+    # row-by-row rules, which skip values _NUMBER_RE rejects.
+    if _SAMPLE_LINES_RE.fullmatch(rest):
+        values.extend(rest.split())
+    else:
+        _read_ecg_rows(csv.reader(rest.splitlines()), metadata, values)
+    return metadata, array("f", map(float, values))
+
+
+def _read_ecg_rows(rows, metadata, values, stop_at_sample=False):
+    for row in rows:
+        if not row:
+            continue
+        if len(row) == 1:
+            value = row[0].strip()
+            if _NUMBER_RE.match(value):
+                values.append(value)
+                if stop_at_sample:
+                    return
+        else:
+            metadata[row[0].strip()] = row[1].strip()
 
 
 def _parse_sample_rate(value):
     if not value:
         return None
-    match = re.search(r"([0-9]+(\.[0-9]+)?)", value)
+    match = _SAMPLE_RATE_RE.search(value)
     if not match:
         return None
-    return float(match.group(1))
+    return float(match.group())
 
 
-def _next_id(conn, table):
-    cursor = conn.cursor()
-    try:
-        cursor.execute(f"SELECT MAX(id) FROM {table}")
-        row = cursor.fetchone()
-        if row and row[0] is not None:
-            return row[0] + 1
-    except sqlite3.OperationalError:
-        pass
-    return 1
+def _float_or_nan(value):
+    value = _to_float(value)
+    return math.nan if value is None else value
 
 
 def _to_float(value):
@@ -451,16 +741,13 @@ def _to_float(value):
         return None
 
 
-def _strip_ns(tag):
-    return tag.split("}")[-1]
-
-
 def main():
     args = parse_args()
     conn = sqlite3.connect(args.db)
     init_db(conn)
     build_source_aliases(conn)
     create_views(conn)
+    create_indexes(conn)
 
     routes_added = 0
     ecg_added = 0
@@ -468,6 +755,10 @@ def main():
         routes_added = import_workout_routes(conn, args.routes_dir, args.skip_existing)
     if not args.no_ecg:
         ecg_added = import_ecg(conn, args.ecg_dir, args.skip_existing)
+    if args.refresh_route_distances:
+        refresh_route_distances(conn)
+    # Last, so a failure here cannot keep routes and ECGs from importing.
+    refresh_daily_aggregates(conn, force=args.rebuild_daily_aggregates)
 
     conn.close()
     print(f"Routes added: {routes_added}")
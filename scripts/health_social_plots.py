@@ -67,18 +67,57 @@ def style():
 
 
 def ensure_views(conn):
-    cursor = conn.execute(
-        "SELECT name FROM sqlite_master WHERE type='view' AND name='records_norm'"
-    )
-    if cursor.fetchone() is None:
+    # records_daily and sleep_daily are per-day aggregates that
+    # health_postprocess.py rebuilds on each run.
+    required = {"records_norm", "records_daily", "sleep_daily"}
+    present = {
+        row[0]
+        for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'view')"
+        )
+    }
+    missing = sorted(required - present)
+    if missing:
         raise RuntimeError(
-            "records_norm view missing. Run scripts/health_postprocess.py first."
+            f"{', '.join(missing)} missing. Run scripts/health_postprocess.py first."
         )
 
 
-def fetch_rows(conn, sql, params=None):
-    cur = conn.execute(sql, params or ())
-    return cur.fetchall()
+def fetch_columns(conn, sql, params=None):
+    # Column-major result: one tuple per selected column, [] for no rows.
+    rows = conn.execute(sql, params or ()).fetchall()
+    return list(zip(*rows)) if rows else []
+
+
+def as_floats(column):
+    # NULLs become NaN.
+    return np.array(column, dtype=np.float64)
+
+
+# Above this many points a scatter is drawn as hexbin cells colored by the
+# mean value, which renders in roughly constant time.
+HEXBIN_MIN_POINTS = 2000
+
+
+def colored_scatter(ax, x, y, c, cmap, alpha, s, xscale="linear"):
+    if len(x) > HEXBIN_MIN_POINTS:
+        # Points with a NaN color are invisible in a scatter; leave them out.
+        keep = np.isfinite(x) & np.isfinite(y) & np.isfinite(c)
+        if xscale == "log":
+            keep &= x > 0
+        return ax.hexbin(
+            x[keep],
+            y[keep],
+            C=c[keep],
+            reduce_C_function=np.mean,
+            gridsize=40,
+            mincnt=1,
+            cmap=cmap,
+            xscale=xscale,
+        )
+    return ax.scatter(
+        x, y, c=c, cmap=cmap, alpha=alpha, s=s, edgecolors="none", rasterized=True
+    )
 
 
 def save_fig(fig, path):
@@ -92,7 +131,7 @@ def to_dates(rows):
 
 
 def plot_chronotype_heatmap(conn, out_dir):
-    rows = fetch_rows(
+    columns = fetch_columns(
         conn,
         """
         WITH asleep AS (
@@ -126,16 +165,13 @@ def plot_chronotype_heatmap(conn, out_dir):
         ORDER BY year, weekday
         """,
     )
-    if not rows:
+    if not columns:
         return None
 
-    years = sorted({int(row[0]) for row in rows})
-    year_index = {year: idx for idx, year in enumerate(years)}
+    year_col, weekday_col, midpoint_col = columns
+    years, year_idx = np.unique(np.array(year_col, dtype=int), return_inverse=True)
     data = np.full((len(years), 7), np.nan)
-    for year, weekday, midpoint in rows:
-        y = year_index[int(year)]
-        x = int(weekday)
-        data[y, x] = midpoint
+    data[year_idx, np.array(weekday_col, dtype=int)] = as_floats(midpoint_col)
 
     fig, ax = plt.subplots(figsize=(10, 7))
     im = ax.imshow(data, aspect="auto", cmap="cividis", vmin=0, vmax=24)
@@ -154,16 +190,13 @@ def plot_chronotype_heatmap(conn, out_dir):
 
 
 def plot_load_recovery_quadrants(conn, out_dir):
-    rows = fetch_rows(
+    columns = fetch_columns(
         conn,
         """
         WITH daily AS (
-          SELECT
-            date(start_dt) AS day,
-            SUM(CASE WHEN type = 'HKQuantityTypeIdentifierActiveEnergyBurned' THEN value_num ELSE 0 END) AS energy_kcal
-          FROM records_norm
+          SELECT day, sum_val AS energy_kcal
+          FROM records_daily
           WHERE type = 'HKQuantityTypeIdentifierActiveEnergyBurned'
-          GROUP BY day
         ),
         workouts AS (
           SELECT
@@ -206,20 +239,20 @@ def plot_load_recovery_quadrants(conn, out_dir):
               AVG(sleep_hours) OVER (ORDER BY day ROWS BETWEEN 27 PRECEDING AND CURRENT ROW) AS sleep_28
             FROM (
               SELECT
-                date(start_dt) AS day,
-                AVG(CASE WHEN type = 'HKQuantityTypeIdentifierRestingHeartRate' THEN value_num END) AS rhr,
-                AVG(CASE WHEN type = 'HKQuantityTypeIdentifierHeartRateVariabilitySDNN' THEN value_num END) AS hrv,
-                AVG(CASE WHEN type = 'HKQuantityTypeIdentifierRespiratoryRate' THEN value_num END) AS resp,
-                SUM(CASE WHEN type = 'HKCategoryTypeIdentifierSleepAnalysis' AND value LIKE '%Asleep%'
-                  THEN (julianday(end_dt) - julianday(start_dt)) * 24.0 END) AS sleep_hours
-              FROM records_norm
-              WHERE type IN (
+                d.day,
+                MAX(CASE WHEN d.type = 'HKQuantityTypeIdentifierRestingHeartRate' THEN d.avg_val END) AS rhr,
+                MAX(CASE WHEN d.type = 'HKQuantityTypeIdentifierHeartRateVariabilitySDNN' THEN d.avg_val END) AS hrv,
+                MAX(CASE WHEN d.type = 'HKQuantityTypeIdentifierRespiratoryRate' THEN d.avg_val END) AS resp,
+                MAX(s.asleep_hours) AS sleep_hours
+              FROM records_daily d
+              LEFT JOIN sleep_daily s ON s.day = d.day
+              WHERE d.type IN (
                 'HKQuantityTypeIdentifierRestingHeartRate',
                 'HKQuantityTypeIdentifierHeartRateVariabilitySDNN',
                 'HKQuantityTypeIdentifierRespiratoryRate',
                 'HKCategoryTypeIdentifierSleepAnalysis'
               )
-              GROUP BY day
+              GROUP BY d.day
             )
           )
           WHERE rhr_28 IS NOT NULL AND hrv_28 IS NOT NULL AND resp_28 IS NOT NULL AND sleep_28 IS NOT NULL
@@ -233,14 +266,14 @@ def plot_load_recovery_quadrants(conn, out_dir):
         ORDER BY load.day
         """,
     )
-    if not rows:
+    if not columns:
         return None
 
-    days = [row[0] for row in rows]
-    loads = np.array([row[1] for row in rows], dtype=float)
-    recovery = np.array([row[2] for row in rows], dtype=float)
+    days, loads, recovery = columns
+    loads = as_floats(loads)
+    recovery = as_floats(recovery)
 
-    years = np.array([int(day[:4]) for day in days])
+    years = np.array([day[:4] for day in days], dtype=int)
     year_min = years.min()
     year_max = years.max()
     colors = (years - year_min) / max(year_max - year_min, 1)
@@ -248,14 +281,8 @@ def plot_load_recovery_quadrants(conn, out_dir):
     load_median = float(np.nanmedian(loads))
 
     fig, ax = plt.subplots(figsize=(10, 7))
-    scatter = ax.scatter(
-        loads,
-        recovery,
-        c=colors,
-        cmap="viridis",
-        alpha=0.6,
-        edgecolors="none",
-        s=22,
+    scatter = colored_scatter(
+        ax, loads, recovery, colors, cmap="viridis", alpha=0.6, s=22
     )
     ax.axvline(load_median, color=PALETTE["muted"], linestyle="--", linewidth=1.2)
     ax.axhline(0, color=PALETTE["muted"], linestyle="--", linewidth=1.2)
@@ -304,21 +331,20 @@ def plot_load_recovery_quadrants(conn, out_dir):
 
 
 def plot_gait_signature(conn, out_dir):
-    rows = fetch_rows(
+    columns = fetch_columns(
         conn,
         """
         WITH steps AS (
-          SELECT date(start_dt) AS day, SUM(value_num) AS steps
-          FROM records_norm
+          SELECT day, sum_val AS steps
+          FROM records_daily
           WHERE type = 'HKQuantityTypeIdentifierStepCount'
-          GROUP BY day
         ),
         gait AS (
           SELECT
-            date(start_dt) AS day,
-            AVG(CASE WHEN type = 'HKQuantityTypeIdentifierWalkingAsymmetryPercentage' THEN value_num END) AS asymmetry,
-            AVG(CASE WHEN type = 'HKQuantityTypeIdentifierWalkingSpeed' THEN value_num END) AS speed
-          FROM records_norm
+            day,
+            MAX(CASE WHEN type = 'HKQuantityTypeIdentifierWalkingAsymmetryPercentage' THEN avg_val END) AS asymmetry,
+            MAX(CASE WHEN type = 'HKQuantityTypeIdentifierWalkingSpeed' THEN avg_val END) AS speed
+          FROM records_daily
           WHERE type IN (
             'HKQuantityTypeIdentifierWalkingAsymmetryPercentage',
             'HKQuantityTypeIdentifierWalkingSpeed'
@@ -336,12 +362,10 @@ def plot_gait_signature(conn, out_dir):
         ORDER BY gait.day
         """,
     )
-    if not rows:
+    if not columns:
         return None
 
-    steps = np.array([row[1] for row in rows], dtype=float)
-    asymmetry = np.array([row[2] for row in rows], dtype=float)
-    speed = np.array([row[3] for row in rows], dtype=float)
+    steps, asymmetry, speed = map(as_floats, columns[1:])
 
     log_steps = np.log10(steps + 1)
     if len(log_steps) > 1:
@@ -350,14 +374,8 @@ def plot_gait_signature(conn, out_dir):
         corr = float("nan")
 
     fig, ax = plt.subplots(figsize=(10, 7))
-    scatter = ax.scatter(
-        steps,
-        asymmetry,
-        c=speed,
-        cmap="plasma",
-        alpha=0.5,
-        s=20,
-        edgecolors="none",
+    scatter = colored_scatter(
+        ax, steps, asymmetry, speed, cmap="plasma", alpha=0.5, s=20, xscale="log"
     )
     ax.set_xscale("log")
     ax.set_title("Gait Signature: Steps vs Asymmetry (color = walking speed)")
@@ -383,28 +401,18 @@ def plot_gait_signature(conn, out_dir):
 
 
 def plot_hrv_rhr_sleep(conn, out_dir):
-    rows = fetch_rows(
+    columns = fetch_columns(
         conn,
         """
         WITH hrv AS (
-          SELECT date(start_dt) AS day, AVG(value_num) AS hrv
-          FROM records_norm
+          SELECT day, avg_val AS hrv
+          FROM records_daily
           WHERE type = 'HKQuantityTypeIdentifierHeartRateVariabilitySDNN'
-          GROUP BY day
         ),
         rhr AS (
-          SELECT date(start_dt) AS day, AVG(value_num) AS rhr
-          FROM records_norm
+          SELECT day, avg_val AS rhr
+          FROM records_daily
           WHERE type = 'HKQuantityTypeIdentifierRestingHeartRate'
-          GROUP BY day
-        ),
-        sleep AS (
-          SELECT
-            date(start_dt) AS day,
-            SUM(CASE WHEN value LIKE '%Asleep%' THEN (julianday(end_dt) - julianday(start_dt)) * 24.0 END) AS asleep_hours
-          FROM records_norm
-          WHERE type = 'HKCategoryTypeIdentifierSleepAnalysis'
-          GROUP BY day
         )
         SELECT
           hrv.day,
@@ -413,28 +421,18 @@ def plot_hrv_rhr_sleep(conn, out_dir):
           sleep.asleep_hours
         FROM hrv
         JOIN rhr ON rhr.day = hrv.day
-        LEFT JOIN sleep ON sleep.day = hrv.day
+        LEFT JOIN sleep_daily sleep ON sleep.day = hrv.day
         WHERE rhr.rhr IS NOT NULL AND hrv.hrv IS NOT NULL
         ORDER BY hrv.day
         """,
     )
-    if not rows:
+    if not columns:
         return None
 
-    rhr = np.array([row[1] for row in rows], dtype=float)
-    hrv = np.array([row[2] for row in rows], dtype=float)
-    sleep = np.array([row[3] if row[3] is not None else np.nan for row in rows])
+    rhr, hrv, sleep = map(as_floats, columns[1:])
 
     fig, ax = plt.subplots(figsize=(10, 7))
-    scatter = ax.scatter(
-        rhr,
-        hrv,
-        c=sleep,
-        cmap="viridis",
-        alpha=0.65,
-        s=26,
-        edgecolors="none",
-    )
+    scatter = colored_scatter(ax, rhr, hrv, sleep, cmap="viridis", alpha=0.65, s=26)
     ax.set_title("HRV vs Resting HR (color = sleep hours)")
     ax.set_xlabel("Resting heart rate (bpm)")
     ax.set_ylabel("HRV SDNN (ms)")
@@ -1,10 +1,26 @@
 #!/usr/bin/env python3
 import argparse
 import json
+import os
 import sqlite3
 import sys
-from collections import defaultdict
-from xml.etree.ElementTree import iterparse
+from itertools import chain, count
+
+from xml.parsers import expat
+
+try:
+    from lxml.etree import iterparse
+
+    HAVE_LXML = True
+except ImportError:
+    HAVE_LXML = False
+
+try:
+    import orjson
+
+    HAVE_ORJSON = True
+except ImportError:
+    HAVE_ORJSON = False
 
 
 def parse_args():
@@ -25,14 +41,22 @@ def parse_args():
     parser.add_argument(
         "--batch-size",
         type=int,
-        default=10000,
-        help="Rows per batch insert (default: 10000)",
+        default=50000,
+        help="Rows per batch insert (default: 50000)",
     )
     parser.add_argument(
         "--with-metadata",
         action="store_true",
         help="Store Record MetadataEntry values (slower, larger DB).",
     )
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        help=(
+            "Bulk-load without journaling or fsync. Faster, but an interrupted "
+            "import can leave the DB corrupt; delete it and re-run."
+        ),
+    )
     return parser.parse_args()
 
 
@@ -135,282 +159,437 @@ CREATE TABLE IF NOT EXISTS record_metadata (
 """
 
 
-def init_db(conn):
+def init_db(conn, fast=False):
     conn.executescript(SCHEMA)
-    conn.execute("PRAGMA journal_mode=WAL;")
-    conn.execute("PRAGMA synchronous=NORMAL;")
+    if fast:
+        conn.execute("PRAGMA journal_mode=OFF;")
+        conn.execute("PRAGMA synchronous=OFF;")
+        conn.execute("PRAGMA locking_mode=EXCLUSIVE;")
+        conn.execute("PRAGMA cache_size=-524288;")
+        conn.execute("PRAGMA mmap_size=30000000000;")
+    else:
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        conn.execute("PRAGMA cache_size=-262144;")
     conn.execute("PRAGMA temp_store=MEMORY;")
 
 
+# SQLite builds before 3.32 cap a statement at 999 bound parameters.
+MAX_PARAMS = 999
+
+
+def insert_many(conn, sql, rows):
+    """executemany(sql, rows), packing many rows into each statement.
+
+    sql must end with a single "(?, ...)" VALUES tuple. Full groups of rows
+    go through one multi-row INSERT each; the remainder uses sql as given.
+    """
+    ncols = len(rows[0])
+    group = max(1, MAX_PARAMS // ncols)
+    full = len(rows) - len(rows) % group
+    if full:
+        placeholders = "(" + ", ".join("?" * ncols) + ")"
+        multi_sql = sql.rstrip() + (",\n" + placeholders) * (group - 1)
+        conn.executemany(
+            multi_sql,
+            (
+                tuple(chain.from_iterable(rows[start : start + group]))
+                for start in range(0, full, group)
+            ),
+        )
+    if full < len(rows):
+        conn.executemany(sql, rows[full:])
+
+
+INSERT_SQL = {
+    "records": """
+    INSERT INTO records (
+      id, type, unit, value, source_name, source_version, device,
+      creation_date, start_date, end_date
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+    "workouts": """
+    INSERT INTO workouts (
+      id, workout_activity_type, duration, duration_unit,
+      total_energy_burned, total_energy_burned_unit,
+      total_distance, total_distance_unit,
+      source_name, source_version, device, creation_date,
+      start_date, end_date
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+    "correlations": """
+    INSERT INTO correlations (
+      id, type, source_name, source_version, device,
+      creation_date, start_date, end_date
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+    "activity_summaries": """
+    INSERT INTO activity_summaries (
+      id, date_components, active_energy_burned,
+      active_energy_burned_goal, active_energy_burned_unit,
+      apple_move_time, apple_move_time_goal,
+      apple_exercise_time, apple_exercise_time_goal,
+      apple_stand_hours, apple_stand_hours_goal
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+    "clinical_records": """
+    INSERT INTO clinical_records (
+      id, type, source_name, source_version, device,
+      creation_date, start_date, end_date, display_name, extra_json
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+    "audiograms": """
+    INSERT INTO audiograms (
+      id, source_name, source_version, device,
+      creation_date, start_date, end_date, extra_json
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+    "vision_prescriptions": """
+    INSERT INTO vision_prescriptions (
+      id, source_name, source_version, device,
+      creation_date, start_date, end_date, extra_json
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+    "record_metadata": (
+        "INSERT INTO record_metadata (record_id, key, value) VALUES (?, ?, ?)"
+    ),
+}
+
+
 def flush(conn, rows_by_table):
-    cursor = conn.cursor()
     for table, rows in rows_by_table.items():
-        if not rows:
-            continue
-        if table == "records":
-            cursor.executemany(
-                """
-                INSERT INTO records (
-                  id, type, unit, value, source_name, source_version, device,
-                  creation_date, start_date, end_date
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                rows,
-            )
-        elif table == "workouts":
-            cursor.executemany(
-                """
-                INSERT INTO workouts (
-                  id, workout_activity_type, duration, duration_unit,
-                  total_energy_burned, total_energy_burned_unit,
-                  total_distance, total_distance_unit,
-                  source_name, source_version, device, creation_date,
-                  start_date, end_date
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                rows,
-            )
-        elif table == "correlations":
-            cursor.executemany(
-                """
-                INSERT INTO correlations (
-                  id, type, source_name, source_version, device,
-                  creation_date, start_date, end_date
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                rows,
-            )
-        elif table == "activity_summaries":
-            cursor.executemany(
-                """
-                INSERT INTO activity_summaries (
-                  id, date_components, active_energy_burned,
-                  active_energy_burned_goal, active_energy_burned_unit,
-                  apple_move_time, apple_move_time_goal,
-                  apple_exercise_time, apple_exercise_time_goal,
-                  apple_stand_hours, apple_stand_hours_goal
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                rows,
-            )
-        elif table == "clinical_records":
-            cursor.executemany(
-                """
-                INSERT INTO clinical_records (
-                  id, type, source_name, source_version, device,
-                  creation_date, start_date, end_date, display_name, extra_json
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                rows,
+        if rows:
+            insert_many(conn, INSERT_SQL[table], rows)
+            rows.clear()
+
+
+def scan_lxml(path, handlers, metadata_rows=None):
+    if metadata_rows is not None:
+        on_record = handlers["Record"]
+        extend_metadata = metadata_rows.extend
+
+        def on_record_with_metadata(elem):
+            record_id = on_record(elem)
+            # MetadataEntry children are still intact here: only elements
+            # with a handler are cleared.
+            extend_metadata(
+                [
+                    (record_id, child.get("key"), child.get("value"))
+                    for child in elem
+                    if child.tag == "MetadataEntry"
+                ]
             )
-        elif table == "audiograms":
-            cursor.executemany(
-                """
-                INSERT INTO audiograms (
-                  id, source_name, source_version, device,
-                  creation_date, start_date, end_date, extra_json
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                rows,
+
+        handlers = dict(handlers, Record=on_record_with_metadata)
+
+    # tag= makes lxml skip events for every other element (MetadataEntry,
+    # InstantaneousBeatsPerMinute, ...) in C; those are read and freed along
+    # with the matched element that contains them.
+    context = iterparse(path, events=("end",), tag=tuple(handlers), huge_tree=True)
+    for _event, elem in context:
+        handlers[elem.tag](elem)
+
+        elem.clear()
+        # lxml keeps cleared elements attached to their parent; drop earlier
+        # siblings so memory stays flat.
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+
+def scan_expat(path, handlers, metadata_rows=None):
+    # Without lxml, drive expat directly: handlers get the attribute dict from
+    # the start tag and no Element objects or tree are ever built.
+    get_handler = handlers.get
+    parser = expat.ParserCreate()
+
+    if metadata_rows is None:
+
+        def on_start(tag, attrs):
+            handler = get_handler(tag)
+            if handler is not None:
+                handler(attrs)
+
+    else:
+        # Only MetadataEntry elements directly under a Record are stored, so
+        # track the open tags; the Record handler returns the row id.
+        open_tags = []
+        push_tag = open_tags.append
+        record_id = None
+
+        def on_start(tag, attrs):
+            nonlocal record_id
+            handler = get_handler(tag)
+            if handler is not None:
+                row_id = handler(attrs)
+                if tag == "Record":
+                    record_id = row_id
+            elif tag == "MetadataEntry" and open_tags[-1] == "Record":
+                metadata_rows.append((record_id, attrs.get("key"), attrs.get("value")))
+            push_tag(tag)
+
+        def on_end(_tag):
+            open_tags.pop()
+
+        parser.EndElementHandler = on_end
+
+    parser.StartElementHandler = on_start
+    with open(path, "rb") as f:
+        parser.ParseFile(f)
+
+
+def scan_export(path, handlers, metadata_rows=None):
+    """Call handlers[tag] for each matching element of export.xml.
+
+    Handlers only use .get() and .items(), so they accept an lxml element or
+    the plain attribute dict expat passes to start-tag callbacks. With
+    metadata_rows, (record_id, key, value) rows for each Record's
+    MetadataEntry children are added to it; the Record handler must return
+    the record id.
+    """
+    scan = scan_lxml if HAVE_LXML else scan_expat
+    scan(path, handlers, metadata_rows)
+
+
+def abort_import(conn, path, fast, created):
+    """Undo a failed import.
+
+    Normally the single import transaction is rolled back. Under --fast there
+    is no journal, so rollback is not guaranteed: a database this run created
+    is deleted, and a pre-existing one is switched back to WAL with a warning.
+    """
+    if not fast:
+        conn.rollback()
+        conn.close()
+        return
+    if created:
+        conn.close()
+        for suffix in ("", "-journal", "-wal", "-shm"):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+        return
+    try:
+        conn.rollback()
+        conn.execute("PRAGMA journal_mode=WAL;")
+    finally:
+        conn.close()
+    print(f"Import failed under --fast; {path} may be inconsistent.", file=sys.stderr)
+
+
+def main():
+    args = parse_args()
+    created = not os.path.exists(args.out)
+    conn = sqlite3.connect(args.out, cached_statements=256)
+    init_db(conn, fast=args.fast)
+
+    # One pending-row list per table, created up front: the handlers bind
+    # their append methods once and flush() empties the lists in place.
+    rows_by_table = {table: [] for table in INSERT_SQL}
+    record_rows = rows_by_table["records"]
+
+    # Ids are handed out strictly increasing, in document order, and rows are
+    # inserted in that order, so every insert appends to the end of the rowid
+    # B-tree. record_metadata needs the record id up front, so ids stay
+    # explicit rather than left to SQLite. Secondary indexes are only built
+    # once the load has committed (create_indexes).
+    record_ids = count(1)
+    workout_ids = count(1)
+    correlation_ids = count(1)
+    activity_summary_ids = count(1)
+    clinical_record_ids = count(1)
+    audiogram_ids = count(1)
+    vision_ids = count(1)
+
+    append_record = record_rows.append
+    append_workout = rows_by_table["workouts"].append
+    append_correlation = rows_by_table["correlations"].append
+    append_activity_summary = rows_by_table["activity_summaries"].append
+    append_clinical_record = rows_by_table["clinical_records"].append
+    append_audiogram = rows_by_table["audiograms"].append
+    append_vision_prescription = rows_by_table["vision_prescriptions"].append
+    # Records left until the next flush; only record rows count toward it.
+    batch_size = args.batch_size
+    until_flush = batch_size
+
+    def on_record(elem):
+        nonlocal until_flush
+        record_id = next(record_ids)
+        get = elem.get
+        append_record(
+            (
+                record_id,
+                get("type"),
+                get("unit"),
+                get("value"),
+                get("sourceName"),
+                get("sourceVersion"),
+                get("device"),
+                get("creationDate"),
+                get("startDate"),
+                get("endDate"),
             )
-        elif table == "vision_prescriptions":
-            cursor.executemany(
-                """
-                INSERT INTO vision_prescriptions (
-                  id, source_name, source_version, device,
-                  creation_date, start_date, end_date, extra_json
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                rows,
+        )
+        until_flush -= 1
+        if until_flush <= 0:
+            flush(conn, rows_by_table)
+            until_flush = batch_size
+        return record_id
+
+    def on_workout(elem):
+        get = elem.get
+        append_workout(
+            (
+                next(workout_ids),
+                get("workoutActivityType"),
+                get("duration") or None,
+                get("durationUnit"),
+                get("totalEnergyBurned") or None,
+                get("totalEnergyBurnedUnit"),
+                get("totalDistance") or None,
+                get("totalDistanceUnit"),
+                get("sourceName"),
+                get("sourceVersion"),
+                get("device"),
+                get("creationDate"),
+                get("startDate"),
+                get("endDate"),
             )
-        elif table == "record_metadata":
-            cursor.executemany(
-                "INSERT INTO record_metadata (record_id, key, value) VALUES (?, ?, ?)",
-                rows,
+        )
+
+    def on_correlation(elem):
+        get = elem.get
+        append_correlation(
+            (
+                next(correlation_ids),
+                get("type"),
+                get("sourceName"),
+                get("sourceVersion"),
+                get("device"),
+                get("creationDate"),
+                get("startDate"),
+                get("endDate"),
             )
-        rows.clear()
-    conn.commit()
+        )
 
+    def on_activity_summary(elem):
+        get = elem.get
+        append_activity_summary(
+            (
+                next(activity_summary_ids),
+                get("dateComponents"),
+                get("activeEnergyBurned") or None,
+                get("activeEnergyBurnedGoal") or None,
+                get("activeEnergyBurnedUnit"),
+                get("appleMoveTime") or None,
+                get("appleMoveTimeGoal") or None,
+                get("appleExerciseTime") or None,
+                get("appleExerciseTimeGoal") or None,
+                get("appleStandHours") or None,
+                get("appleStandHoursGoal") or None,
+            )
+        )
 
-def main():
-    args = parse_args()
-    conn = sqlite3.connect(args.out)
-    init_db(conn)
+    def on_clinical_record(elem):
+        get = elem.get
+        append_clinical_record(
+            (
+                next(clinical_record_ids),
+                get("type"),
+                get("sourceName"),
+                get("sourceVersion"),
+                get("device"),
+                get("creationDate"),
+                get("startDate"),
+                get("endDate"),
+                get("displayName"),
+                _json_dumps(dict(elem.items())),
+            )
+        )
 
-    record_id = 0
-    workout_id = 0
-    correlation_id = 0
-    activity_summary_id = 0
-    clinical_record_id = 0
-    audiogram_id = 0
-    vision_id = 0
+    def on_audiogram(elem):
+        get = elem.get
+        append_audiogram(
+            (
+                next(audiogram_ids),
+                get("sourceName"),
+                get("sourceVersion"),
+                get("device"),
+                get("creationDate"),
+                get("startDate"),
+                get("endDate"),
+                _json_dumps(dict(elem.items())),
+            )
+        )
 
-    rows_by_table = defaultdict(list)
+    def on_vision_prescription(elem):
+        get = elem.get
+        append_vision_prescription(
+            (
+                next(vision_ids),
+                get("sourceName"),
+                get("sourceVersion"),
+                get("device"),
+                get("creationDate"),
+                get("startDate"),
+                get("endDate"),
+                _json_dumps(dict(elem.items())),
+            )
+        )
 
-    in_record = False
-    record_metadata = []
+    handlers = {
+        "Record": on_record,
+        "Workout": on_workout,
+        "Correlation": on_correlation,
+        "ActivitySummary": on_activity_summary,
+        "ClinicalRecord": on_clinical_record,
+        "Audiogram": on_audiogram,
+        "VisionPrescription": on_vision_prescription,
+    }
 
+    # One transaction for the whole import: flush() only inserts, and the
+    # single commit below is the only sync point. Without --fast a failure
+    # rolls the whole import back; see abort_import for --fast.
+    conn.execute("BEGIN")
     try:
-        for event, elem in iterparse(args.export, events=("start", "end")):
-            if event == "start":
-                if elem.tag == "Record":
-                    in_record = True
-                    record_metadata = []
-            elif event == "end":
-                if elem.tag == "MetadataEntry" and args.with_metadata and in_record:
-                    key = elem.attrib.get("key")
-                    value = elem.attrib.get("value")
-                    record_metadata.append((key, value))
-                elif elem.tag == "Record":
-                    record_id += 1
-                    attrs = elem.attrib
-                    rows_by_table["records"].append(
-                        (
-                            record_id,
-                            attrs.get("type"),
-                            attrs.get("unit"),
-                            attrs.get("value"),
-                            attrs.get("sourceName"),
-                            attrs.get("sourceVersion"),
-                            attrs.get("device"),
-                            attrs.get("creationDate"),
-                            attrs.get("startDate"),
-                            attrs.get("endDate"),
-                        )
-                    )
-                    if args.with_metadata and record_metadata:
-                        rows_by_table["record_metadata"].extend(
-                            (record_id, key, value) for key, value in record_metadata
-                        )
-                    in_record = False
-                elif elem.tag == "Workout":
-                    workout_id += 1
-                    attrs = elem.attrib
-                    rows_by_table["workouts"].append(
-                        (
-                            workout_id,
-                            attrs.get("workoutActivityType"),
-                            _to_float(attrs.get("duration")),
-                            attrs.get("durationUnit"),
-                            _to_float(attrs.get("totalEnergyBurned")),
-                            attrs.get("totalEnergyBurnedUnit"),
-                            _to_float(attrs.get("totalDistance")),
-                            attrs.get("totalDistanceUnit"),
-                            attrs.get("sourceName"),
-                            attrs.get("sourceVersion"),
-                            attrs.get("device"),
-                            attrs.get("creationDate"),
-                            attrs.get("startDate"),
-                            attrs.get("endDate"),
-                        )
-                    )
-                elif elem.tag == "Correlation":
-                    correlation_id += 1
-                    attrs = elem.attrib
-                    rows_by_table["correlations"].append(
-                        (
-                            correlation_id,
-                            attrs.get("type"),
-                            attrs.get("sourceName"),
-                            attrs.get("sourceVersion"),
-                            attrs.get("device"),
-                            attrs.get("creationDate"),
-                            attrs.get("startDate"),
-                            attrs.get("endDate"),
-                        )
-                    )
-                elif elem.tag == "ActivitySummary":
-                    activity_summary_id += 1
-                    attrs = elem.attrib
-                    rows_by_table["activity_summaries"].append(
-                        (
-                            activity_summary_id,
-                            attrs.get("dateComponents"),
-                            _to_float(attrs.get("activeEnergyBurned")),
-                            _to_float(attrs.get("activeEnergyBurnedGoal")),
-                            attrs.get("activeEnergyBurnedUnit"),
-                            _to_float(attrs.get("appleMoveTime")),
-                            _to_float(attrs.get("appleMoveTimeGoal")),
-                            _to_float(attrs.get("appleExerciseTime")),
-                            _to_float(attrs.get("appleExerciseTimeGoal")),
-                            _to_float(attrs.get("appleStandHours")),
-                            _to_float(attrs.get("appleStandHoursGoal")),
-                        )
-                    )
-                elif elem.tag == "ClinicalRecord":
-                    clinical_record_id += 1
-                    attrs = elem.attrib
-                    rows_by_table["clinical_records"].append(
-                        (
-                            clinical_record_id,
-                            attrs.get("type"),
-                            attrs.get("sourceName"),
-                            attrs.get("sourceVersion"),
-                            attrs.get("device"),
-                            attrs.get("creationDate"),
-                            attrs.get("startDate"),
-                            attrs.get("endDate"),
-                            attrs.get("displayName"),
-                            json.dumps(attrs, ensure_ascii=True),
-                        )
-                    )
-                elif elem.tag == "Audiogram":
-                    audiogram_id += 1
-                    attrs = elem.attrib
-                    rows_by_table["audiograms"].append(
-                        (
-                            audiogram_id,
-                            attrs.get("sourceName"),
-                            attrs.get("sourceVersion"),
-                            attrs.get("device"),
-                            attrs.get("creationDate"),
-                            attrs.get("startDate"),
-                            attrs.get("endDate"),
-                            json.dumps(attrs, ensure_ascii=True),
-                        )
-                    )
-                elif elem.tag == "VisionPrescription":
-                    vision_id += 1
-                    attrs = elem.attrib
-                    rows_by_table["vision_prescriptions"].append(
-                        (
-                            vision_id,
-                            attrs.get("sourceName"),
-                            attrs.get("sourceVersion"),
-                            attrs.get("device"),
-                            attrs.get("creationDate"),
-                            attrs.get("startDate"),
-                            attrs.get("endDate"),
-                            json.dumps(attrs, ensure_ascii=True),
-                        )
-                    )
-
-                elem.clear()
-
-                if len(rows_by_table["records"]) >= args.batch_size:
-                    flush(conn, rows_by_table)
+        scan_export(
+            args.export,
+            handlers,
+            rows_by_table["record_metadata"] if args.with_metadata else None,
+        )
+        flush(conn, rows_by_table)
     except FileNotFoundError:
+        abort_import(conn, args.out, args.fast, created)
         print(f"File not found: {args.export}", file=sys.stderr)
         return 2
+    except BaseException:
+        abort_import(conn, args.out, args.fast, created)
+        raise
+    conn.commit()
 
-    flush(conn, rows_by_table)
     create_indexes(conn)
+    if args.fast:
+        # Leave the DB in WAL mode, as a normal run would, for the
+        # postprocess and plotting scripts.
+        conn.execute("PRAGMA journal_mode=WAL;")
     conn.close()
     print(f"Wrote {args.out}")
     return 0
 
 
-def _to_float(value):
-    if value is None or value == "":
-        return None
-    try:
-        return float(value)
-    except ValueError:
-        return None
+def _json_dumps(obj):
+    # Both branches produce the same compact UTF-8 text.
+    if HAVE_ORJSON:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
 
 
 def create_indexes(conn):
-    conn.execute("CREATE INDEX IF NOT EXISTS idx_records_type ON records(type);")
+    # (type, start_date) also serves lookups on type alone; health_postprocess
+    # creates the same index for databases ingested before it lived here.
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_records_type_start ON records(type, start_date);"
+    )
     conn.execute("CREATE INDEX IF NOT EXISTS idx_records_start_date ON records(start_date);")
     conn.execute("CREATE INDEX IF NOT EXISTS idx_records_source ON records(source_name);")
     conn.execute("CREATE INDEX IF NOT EXISTS idx_workouts_type ON workouts(workout_activity_type);")